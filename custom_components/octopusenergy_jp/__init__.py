@@ -10,9 +10,20 @@ from homeassistant.const import (
     Platform
 )
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.typing import ConfigType
 
-from .const import DOMAIN, CONF_ACCOUNT_NUMBER, CONF_SCAN_INTERVAL
+from .api import OctopusEnergyJP
+from .const import (
+    DOMAIN,
+    CONF_ACCOUNT_NUMBER,
+    CONF_SCAN_INTERVAL,
+    STORAGE_KEY_DATA,
+    STORAGE_KEY_TOKEN,
+    STORAGE_VERSION,
+    TOKEN_SAVE_DELAY,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -29,6 +40,22 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Octopus Energy Japan from a config entry."""
+    # 保存令牌和持久化查询探测结果，避免每次重启都重新登录和探测
+    token_store = Store(hass, STORAGE_VERSION, STORAGE_KEY_TOKEN.format(entry_id=entry.entry_id))
+
+    def save_token() -> None:
+        token_store.async_delay_save(lambda: api.token_data, TOKEN_SAVE_DELAY)
+
+    api = OctopusEnergyJP(
+        session=async_get_clientsession(hass),
+        email=entry.data[CONF_EMAIL],
+        password=entry.data[CONF_PASSWORD],
+        account_number=entry.data[CONF_ACCOUNT_NUMBER],
+        initial_token=await token_store.async_load(),
+        token_callback=save_token,
+    )
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = api
+
     for platform in PLATFORMS:
         hass.async_create_task(
             hass.config_entries.async_forward_entry_setup(entry, platform)
@@ -40,4 +67,11 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id, None)
-    return unload_ok 
\ No newline at end of file
+    return unload_ok
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove stored data when a config entry is removed."""
+    for key in (STORAGE_KEY_TOKEN, STORAGE_KEY_DATA):
+        await Store(
+            hass, STORAGE_VERSION, key.format(entry_id=entry.entry_id)
+        ).async_remove() 
\ No newline at end of file
@@ -1,17 +1,216 @@
 """API client for Octopus Energy Japan."""
+import asyncio
+import functools
+import hashlib
+import json
 import logging
 import time
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 import aiohttp
 from aiohttp import ClientSession
 import async_timeout
+from yarl import URL
 
-from .const import API_ENDPOINT, TOKEN_VALID_DURATION
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from .const import (
+    API_ENDPOINT,
+    CACHE_MAX_SIZE,
+    CACHE_TTL_READINGS,
+    TOKEN_VALID_DURATION,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+API_URL = URL(API_ENDPOINT)
+BASE_HEADERS = {
+    "Content-Type": "application/json",
+    "Connection": "keep-alive",
+    "Accept-Encoding": "gzip, deflate",
+}
+
+
+def _compact(query: str) -> str:
+    """Collapse whitespace in a GraphQL document to shrink the request body."""
+    return " ".join(query.split())
+
+
+_TOKEN_SELECTION = """
+    obtainKrakenToken(input: $input) {
+        token
+        refreshToken
+    }
+"""
+
+_LOGIN_MUTATION = _compact("""
+mutation login($input: ObtainJSONWebTokenInput!) {
+""" + _TOKEN_SELECTION + """
+}
+""")
+
+_REFRESH_MUTATION = _compact("""
+mutation refreshToken($input: ObtainJSONWebTokenInput!) {
+""" + _TOKEN_SELECTION + """
+}
+""")
+
+_MEASUREMENT_EDGES = """
+    edges {
+        node {
+            value
+            unit
+            startAt
+            endAt
+            durationInSeconds
+            metaData {
+                statistics {
+                    costExclTax {
+                        pricePerUnit {
+                            amount
+                        }
+                        costCurrency
+                        estimatedAmount
+                    }
+                    costInclTax {
+                        costCurrency
+                        estimatedAmount
+                    }
+                    value
+                    description
+                    label
+                    type
+                }
+            }
+        }
+    }
+"""
+
+_COMBINED_QUERY = _compact("""
+query combinedReadings(
+    $accountNumber: String!
+    $propertyId: ID!
+    $yesterdayFrom: DateTime
+    $yesterdayTo: DateTime
+    $first: Int!
+    $utilityFilters: [UtilityFiltersInput!]
+    $hourlyStartAt: DateTime
+    $hourlyEndAt: DateTime
+    $timezone: String
+) {
+    yesterday: account(accountNumber: $accountNumber) {
+        properties {
+            electricitySupplyPoints {
+                halfHourlyReadings(
+                    fromDatetime: $yesterdayFrom
+                    toDatetime: $yesterdayTo
+                ) {
+                    costEstimate
+                    value
+                }
+            }
+        }
+    }
+    hourly: property(id: $propertyId) {
+        measurements(
+            first: $first
+            utilityFilters: $utilityFilters
+            startAt: $hourlyStartAt
+            endAt: $hourlyEndAt
+            timezone: $timezone
+        ) {
+""" + _MEASUREMENT_EDGES + """
+        }
+    }
+}
+""")
+
+
+# Read queries are sent as Automatic Persisted Queries when the server supports them
+_PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+_PERSISTED_QUERY_NOT_SUPPORTED = "PersistedQueryNotSupported"
+_MISSING_QUERY_MESSAGE = "must provide query string"
+_QUERY_HASHES = {
+    query: hashlib.sha256(query.encode()).hexdigest()
+    for query in (_COMBINED_QUERY,)
+}
+
+
+def utc_midnight() -> datetime:
+    """Return the most recent midnight in UTC as an aware datetime."""
+    return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _json_dumps(data: Any) -> bytes:
+    """Serialize a request body, using orjson when it is available."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode()
+
+
+def _json_loads(data: bytes) -> Any:
+    """Parse a response body, using orjson when it is available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _flatten(value: Any, path: Tuple = ()) -> Iterator[Tuple[Tuple, str, Any]]:
+    """Yield (path, type name, leaf) triples for nested GraphQL variables.
+
+    The type name keeps values that compare equal, such as True and 1, apart.
+    Empty dicts and lists are yielded as leaves so they still count.
+    """
+    if isinstance(value, dict) and value:
+        for key, item in value.items():
+            yield from _flatten(item, path + (key,))
+    elif isinstance(value, list) and value:
+        for index, item in enumerate(value):
+            yield from _flatten(item, path + (index,))
+    elif isinstance(value, (dict, list)):
+        yield path, type(value).__name__, None
+    else:
+        yield path, type(value).__name__, value
+
+
+def _freeze_variables(variables: Optional[Dict[str, Any]]) -> Tuple[Tuple[Tuple, str, Any], ...]:
+    """Return a hashable, order-independent form of the variables."""
+    return tuple(sorted(_flatten(variables or {})))
+
+
+def _encode_body(
+    query: Optional[str],
+    variables: Optional[Dict[str, Any]],
+    query_hash: Optional[str] = None,
+) -> bytes:
+    """Build the JSON body for a GraphQL request.
+
+    The query is omitted for hash-only persisted queries, and the
+    persistedQuery extension is added when query_hash is given.
+    """
+    payload: Dict[str, Any] = {"variables": variables}
+    if query is not None:
+        payload["query"] = query
+    if query_hash is not None:
+        payload["extensions"] = {
+            "persistedQuery": {"version": 1, "sha256Hash": query_hash}
+        }
+    return _json_dumps(payload)
+
+
+@functools.lru_cache(maxsize=64)
+def _iso(value: datetime) -> str:
+    """Format a UTC datetime the way the Kraken API expects."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return f"{value.replace(microsecond=0).isoformat()}.000Z"
+
+
 class AuthenticationError(Exception):
     """Exception when authentication fails."""
 
@@ -29,8 +228,14 @@ class OctopusEnergyJP:
         email: str,
         password: str,
         account_number: str,
+        initial_token: Optional[Dict[str, Any]] = None,
+        token_callback: Optional[Callable[[], None]] = None,
     ) -> None:
-        """Initialize the API client."""
+        """Initialize the API client.
+
+        initial_token is a dict previously returned by token_data, and
+        token_callback is called whenever token_data changes.
+        """
         self.session = session
         self.email = email
         self.password = password
@@ -38,6 +243,47 @@ class OctopusEnergyJP:
         self.token: Optional[str] = None
         self.refresh_token: Optional[str] = None
         self.token_expiry = 0
+        # None until the first persisted query shows whether the server supports them
+        self._apq_supported: Optional[bool] = None
+        if initial_token:
+            self.token = initial_token.get("token")
+            self.refresh_token = initial_token.get("refresh_token")
+            self.token_expiry = initial_token.get("expiry", 0)
+            self._apq_supported = initial_token.get("apq_supported")
+        self._token_callback = token_callback
+        self._token_lock = asyncio.Lock()
+        self._encoding_logged = False
+        self._cache: "OrderedDict[tuple, tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    @property
+    def token_data(self) -> Dict[str, Any]:
+        """Return the current token state in a serializable form.
+
+        This also carries the persisted query probe result, so a restart does
+        not probe the server again.
+        """
+        return {
+            "token": self.token,
+            "refresh_token": self.refresh_token,
+            "expiry": self.token_expiry,
+            "apq_supported": self._apq_supported,
+        }
+
+    def _set_token(self, data: Dict[str, Any]) -> None:
+        """Store a token returned by the obtainKrakenToken mutation."""
+        self.token = data["token"]
+        self.refresh_token = data["refreshToken"]
+        self.token_expiry = time.time() + TOKEN_VALID_DURATION
+        if self._token_callback is not None:
+            self._token_callback()
+
+    def _set_apq_supported(self, supported: bool) -> None:
+        """Record whether the server supports persisted queries."""
+        if self._apq_supported is supported:
+            return
+        self._apq_supported = supported
+        if self._token_callback is not None:
+            self._token_callback()
 
     async def async_get_token(self) -> str:
         """Get auth token."""
@@ -45,222 +291,225 @@ class OctopusEnergyJP:
         if self.token and time.time() < self.token_expiry:
             return self.token
 
-        # If refresh token exists, try to use it
-        if self.refresh_token:
-            try:
-                await self._refresh_token()
+        # Only one caller logs in; the others wait and reuse its token
+        async with self._token_lock:
+            if self.token and time.time() < self.token_expiry:
                 return self.token
-            except Exception:
-                _LOGGER.warning("Failed to refresh token, getting new token")
-
-        # Otherwise get a new token with email/password
-        login_mutation = """
-        mutation login($input: ObtainJSONWebTokenInput!) {
-          obtainKrakenToken(input: $input) {
-            token
-            refreshToken
-          }
-        }
-        """
 
-        variables = {
-            "input": {
-                "email": self.email,
-                "password": self.password,
+            # If refresh token exists, try to use it
+            if self.refresh_token:
+                try:
+                    await self._refresh_token()
+                    return self.token
+                except Exception:
+                    _LOGGER.warning("Failed to refresh token, getting new token")
+
+            # Otherwise get a new token with email/password
+            variables = {
+                "input": {
+                    "email": self.email,
+                    "password": self.password,
+                }
             }
-        }
 
-        response = await self._graphql_request(login_mutation, variables, auth_required=False)
-        try:
-            data = response["data"]["obtainKrakenToken"]
-            self.token = data["token"]
-            self.refresh_token = data["refreshToken"]
-            self.token_expiry = time.time() + TOKEN_VALID_DURATION
-            return self.token
-        except (KeyError, TypeError) as err:
-            raise AuthenticationError(f"Failed to get token: {err}") from err
+            response = await self._graphql_request(_LOGIN_MUTATION, variables, auth_required=False)
+            try:
+                self._set_token(response["data"]["obtainKrakenToken"])
+                return self.token
+            except (KeyError, TypeError) as err:
+                raise AuthenticationError(f"Failed to get token: {err}") from err
 
     async def _refresh_token(self) -> None:
-        """Refresh the authentication token."""
-        login_mutation = """
-        mutation refreshToken($input: ObtainJSONWebTokenInput!) {
-          obtainKrakenToken(input: $input) {
-            token
-            refreshToken
-          }
-        }
-        """
+        """Refresh the authentication token.
 
+        Only called from async_get_token, which already holds the token lock.
+        """
         variables = {
             "input": {
                 "refreshToken": self.refresh_token,
             }
         }
 
-        response = await self._graphql_request(login_mutation, variables, auth_required=False)
+        response = await self._graphql_request(_REFRESH_MUTATION, variables, auth_required=False)
         try:
-            data = response["data"]["obtainKrakenToken"]
-            self.token = data["token"]
-            self.refresh_token = data["refreshToken"]
-            self.token_expiry = time.time() + TOKEN_VALID_DURATION
+            self._set_token(response["data"]["obtainKrakenToken"])
         except (KeyError, TypeError) as err:
             raise AuthenticationError(f"Failed to refresh token: {err}") from err
 
     async def _graphql_request(
-        self, query: str, variables: Dict[str, Any] = None, auth_required: bool = True
+        self,
+        query: str,
+        variables: Dict[str, Any] = None,
+        auth_required: bool = True,
+        cache_ttl: Optional[float] = None,
     ) -> Dict[str, Any]:
-        """Make a request to the GraphQL API."""
-        headers = {"Content-Type": "application/json"}
+        """Make a request to the GraphQL API.
+
+        If cache_ttl is given, successful responses are kept in memory for that
+        many seconds and identical requests are answered from the cache. Only
+        read queries pass cache_ttl; mutations such as login are never cached.
+        """
+        cache_key = None
+        if cache_ttl:
+            cache_key = (query, _freeze_variables(variables))
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                timestamp, cached_json = cached
+                if time.monotonic() - timestamp < cache_ttl:
+                    self._cache.move_to_end(cache_key)
+                    return cached_json
+                del self._cache[cache_key]
+
+        headers = dict(BASE_HEADERS)
 
         if auth_required:
             token = await self.async_get_token()
             headers["Authorization"] = token
 
+        query_hash = None
+        if self._apq_supported is not False:
+            query_hash = _QUERY_HASHES.get(query)
+
         try:
             async with async_timeout.timeout(20):
-                response = await self.session.post(
-                    API_ENDPOINT,
-                    headers=headers,
-                    json={"query": query, "variables": variables},
-                )
-                response_json = await response.json()
+                if query_hash is None:
+                    response_json = await self._post(
+                        headers, _encode_body(query, variables)
+                    )
+                else:
+                    response_json = await self._persisted_request(
+                        headers, query, query_hash, variables
+                    )
 
-                if "errors" in response_json:
-                    error_message = response_json["errors"][0]["message"]
-                    raise APIError(f"GraphQL error: {error_message}")
+                errors = response_json.get("errors")
+                if errors:
+                    raise APIError(f"GraphQL error: {errors[0]['message']}")
+
+                if cache_key is not None:
+                    self._cache[cache_key] = (time.monotonic(), response_json)
+                    if len(self._cache) > CACHE_MAX_SIZE:
+                        self._cache.popitem(last=False)
 
                 return response_json
         except aiohttp.ClientError as err:
             raise APIError(f"Request failed: {err}") from err
+        except ValueError as err:
+            raise APIError(f"Invalid JSON response: {err}") from err
 
-    async def async_get_electricity_usage(
-        self, from_datetime: datetime, to_datetime: datetime
-    ) -> List[Dict[str, Any]]:
-        """Get electricity usage data."""
-        query = """
-        query halfHourlyReadings(
-            $accountNumber: String!
-            $fromDatetime: DateTime
-            $toDatetime: DateTime
-        ) {
-            account(accountNumber: $accountNumber) {
-                properties {
-                    electricitySupplyPoints {
-                        status
-                        agreements {
-                            validFrom
-                        }
-                        halfHourlyReadings(
-                            fromDatetime: $fromDatetime
-                            toDatetime: $toDatetime
-                        ) {
-                            consumptionRateBand
-                            consumptionStep
-                            costEstimate
-                            startAt
-                            value
-                        }
-                    }
-                }
-            }
-        }
+    async def _persisted_request(
+        self,
+        headers: Dict[str, str],
+        query: str,
+        query_hash: str,
+        variables: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """Send a query by its hash, falling back to the full document.
+
+        If the server does not know the hash yet, the full query is sent along
+        with the hash so it can be registered. Persisted queries are disabled
+        when the server says it does not support them, or when the first
+        hash-only request fails with another error but the full query then
+        succeeds. Once they have worked, other errors are returned as-is.
         """
+        response_json = await self._post(
+            headers, _encode_body(None, variables, query_hash)
+        )
 
-        variables = {
-            "accountNumber": self.account_number,
-            "fromDatetime": from_datetime.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-            "toDatetime": to_datetime.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-        }
+        errors = response_json.get("errors")
+        if not errors:
+            self._set_apq_supported(True)
+            return response_json
 
-        try:
-            response = await self._graphql_request(query, variables)
-            readings = response["data"]["account"]["properties"][0]["electricitySupplyPoints"][0]["halfHourlyReadings"]
-            return readings
-        except (KeyError, IndexError) as err:
-            _LOGGER.error("Failed to parse electricity usage data: %s", err)
-            return []
-
-    async def async_get_yesterday_data(self) -> Dict[str, float]:
-        """Get yesterday's electricity usage and cost data."""
-        # Get yesterday's date in UTC
-        today_utc = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        yesterday_utc = today_utc - timedelta(days=1)
-        
-        # Get data for the entire day
-        from_datetime = yesterday_utc
-        to_datetime = today_utc - timedelta(seconds=1)  # 23:59:59 yesterday
-        
-        readings = await self.async_get_electricity_usage(from_datetime, to_datetime)
-        
+        message = errors[0].get("message") or ""
+        if message == _PERSISTED_QUERY_NOT_FOUND:
+            return await self._post(
+                headers, _encode_body(query, variables, query_hash)
+            )
+
+        if self._apq_supported:
+            return response_json
+
+        if (
+            message == _PERSISTED_QUERY_NOT_SUPPORTED
+            or _MISSING_QUERY_MESSAGE in message.lower()
+        ):
+            _LOGGER.debug("Persisted queries not supported, sending full queries")
+            self._set_apq_supported(False)
+            return await self._post(headers, _encode_body(query, variables))
+
+        # The error may be unrelated (e.g. a stale token), so only give up on
+        # persisted queries if the full query works where the hash did not
+        full_json = await self._post(headers, _encode_body(query, variables))
+        if not full_json.get("errors"):
+            _LOGGER.debug("Persisted queries not supported, sending full queries")
+            self._set_apq_supported(False)
+        return full_json
+
+    async def _post(self, headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+        """POST an encoded GraphQL body and return the decoded JSON response."""
+        async with self.session.post(
+            API_URL,
+            headers=headers,
+            data=body,
+        ) as response:
+            if not self._encoding_logged:
+                self._encoding_logged = True
+                _LOGGER.debug(
+                    "API response Content-Encoding: %s",
+                    response.headers.get("Content-Encoding"),
+                )
+            return _json_loads(await response.read())
+
+    @staticmethod
+    def _summarize_readings(readings: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Sum half-hourly readings into total usage and cost.
+
+        "complete_readings" counts the readings that carried both a value and
+        a cost estimate, so callers can tell whether the totals have settled.
+        """
         if not readings:
-            return {"energy_usage": 0.0, "energy_cost": 0.0}
-            
-        # Calculate total usage and cost
-        total_usage = sum(float(reading["value"]) for reading in readings if reading.get("value"))
-        total_cost = sum(float(reading["costEstimate"]) for reading in readings if reading.get("costEstimate"))
-        
+            return {"energy_usage": 0.0, "energy_cost": 0.0, "complete_readings": 0}
+
+        # Calculate total usage and cost in a single pass
+        total_usage = total_cost = 0.0
+        complete = 0
+        for reading in readings:
+            value = reading.get("value")
+            cost = reading.get("costEstimate")
+            if value:
+                total_usage += float(value)
+            if cost:
+                total_cost += float(cost)
+            if value is not None and cost is not None:
+                complete += 1
+
         return {
             "energy_usage": round(total_usage, 2),
             "energy_cost": round(total_cost, 2),
+            "complete_readings": complete,
         }
 
-    async def async_get_hourly_data(self, start_at: datetime, end_at: datetime) -> List[Dict[str, Any]]:
-        """Get hourly electricity usage data."""
-        query = """
-        query getAccountMeasurements(
-            $propertyId: ID!
-            $first: Int!
-            $utilityFilters: [UtilityFiltersInput!]
-            $startAt: DateTime
-            $endAt: DateTime
-            $timezone: String
-        ) {
-            property(id: $propertyId) {
-                measurements(
-                    first: $first
-                    utilityFilters: $utilityFilters
-                    startAt: $startAt
-                    endAt: $endAt
-                    timezone: $timezone
-                ) {
-                    edges {
-                        node {
-                            value
-                            unit
-                            startAt
-                            endAt
-                            durationInSeconds
-                            metaData {
-                                statistics {
-                                    costExclTax {
-                                        pricePerUnit {
-                                            amount
-                                        }
-                                        costCurrency
-                                        estimatedAmount
-                                    }
-                                    costInclTax {
-                                        costCurrency
-                                        estimatedAmount
-                                    }
-                                    value
-                                    description
-                                    label
-                                    type
-                                }
-                            }
-                        }
-                    }
-                }
-            }
-        }
-        """
+    async def async_get_combined(
+        self,
+        yesterday_from: datetime,
+        yesterday_to: datetime,
+        hourly_start: datetime,
+        hourly_end: datetime,
+    ) -> Dict[str, Any]:
+        """Get yesterday's totals and hourly data in one request.
 
+        Returns a dict with yesterday's "energy_usage" and "energy_cost"
+        totals, the "complete_readings" count behind them, and the half-hourly
+        "hourly_data" measurements.
+        """
         variables = {
+            "accountNumber": self.account_number,
             "propertyId": self.account_number,
+            "yesterdayFrom": _iso(yesterday_from),
+            "yesterdayTo": _iso(yesterday_to),
             "first": 100,
-            "startAt": start_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-            "endAt": end_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "hourlyStartAt": _iso(hourly_start),
+            "hourlyEndAt": _iso(hourly_end),
             "timezone": "Asia/Tokyo",
             "utilityFilters": [{
                 "electricityFilters": {
@@ -271,16 +520,22 @@ class OctopusEnergyJP:
             }]
         }
 
+        response = await self._graphql_request(
+            _COMBINED_QUERY, variables, cache_ttl=CACHE_TTL_READINGS
+        )
+        data = response.get("data") or {}
+
+        try:
+            readings = data["yesterday"]["properties"][0]["electricitySupplyPoints"][0]["halfHourlyReadings"]
+        except (KeyError, IndexError, TypeError) as err:
+            _LOGGER.error("Failed to parse electricity usage data: %s", err)
+            readings = []
+        result: Dict[str, Any] = self._summarize_readings(readings)
+
         try:
-            response = await self._graphql_request(query, variables)
-            measurements = response["data"]["property"]["measurements"]["edges"]
-            return [edge["node"] for edge in measurements]
-        except (KeyError, IndexError) as err:
+            result["hourly_data"] = [edge["node"] for edge in data["hourly"]["measurements"]["edges"]]
+        except (KeyError, IndexError, TypeError) as err:
             _LOGGER.error("Failed to parse hourly data: %s", err)
-            return []
+            result["hourly_data"] = []
 
-    async def async_get_two_weeks_data(self) -> List[Dict[str, Any]]:
-        """Get two weeks of electricity usage data."""
-        end_at = datetime.utcnow()
-        start_at = end_at - timedelta(days=14)
-        return await self.async_get_hourly_data(start_at, end_at) 
\ No newline at end of file
+        return result
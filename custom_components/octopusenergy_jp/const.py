@@ -10,6 +10,17 @@ CONF_SCAN_INTERVAL = "scan_interval"
 # API
 API_ENDPOINT = "https://api.oejp-kraken.energy/v1/graphql/"
 TOKEN_VALID_DURATION = 3600  # Token valid for 1 hour (3600 seconds)
+TOKEN_SAVE_DELAY = 5  # Seconds to wait before writing a new token to storage
+READINGS_PER_DAY = 48  # Half-hourly readings in a complete day
+CACHE_MAX_SIZE = 64  # Maximum number of cached GraphQL responses
+# Cache readings responses for 5 minutes. Scheduled refreshes are at least an
+# hour apart, so hits only come from manual entity updates within this window.
+CACHE_TTL_READINGS = 300
+
+# Storage
+STORAGE_VERSION = 1
+STORAGE_KEY_TOKEN = f"{DOMAIN}.{{entry_id}}.token"
+STORAGE_KEY_DATA = f"{DOMAIN}.{{entry_id}}.data"
 
 # Sensor
 ENERGY_USAGE_SENSOR = "energy_usage"
@@ -25,4 +36,5 @@ ICON_ENERGY = "mdi:flash"
 ICON_MONEY = "mdi:currency-jpy"
 
 # Default values
-DEFAULT_SCAN_INTERVAL_HOURS = 3  # Default scan interval in hours 
\ No newline at end of file
+DEFAULT_SCAN_INTERVAL_HOURS = 3  # Default scan interval in hours
+MAX_SCAN_INTERVAL_HOURS = 12  # Upper bound when backing off unchanged data 
\ No newline at end of file
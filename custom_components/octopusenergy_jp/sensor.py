@@ -1,7 +1,7 @@
 """Sensor platform for Octopus Energy Japan integration."""
 import logging
-from datetime import timedelta, datetime
-from typing import Any, Dict, List, Optional
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
 
 from homeassistant.components.sensor import (
     SensorDeviceClass,
@@ -9,22 +9,20 @@ from homeassistant.components.sensor import (
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import (
-    CONF_EMAIL,
-    CONF_PASSWORD,
-    UnitOfEnergy,
-)
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.const import UnitOfEnergy
+from homeassistant.core import CoreState, HomeAssistant, callback
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.typing import StateType
 from homeassistant.helpers.update_coordinator import (
     CoordinatorEntity,
     DataUpdateCoordinator,
+    UpdateFailed,
 )
+from homeassistant.util import dt as dt_util
 
-from .api import OctopusEnergyJP
+from .api import APIError, AuthenticationError, OctopusEnergyJP, utc_midnight
 from .const import (
     ATTRIBUTION,
     CONF_ACCOUNT_NUMBER,
@@ -35,7 +33,11 @@ from .const import (
     ENERGY_USAGE_SENSOR,
     ICON_ENERGY,
     ICON_MONEY,
+    MAX_SCAN_INTERVAL_HOURS,
     NAME,
+    READINGS_PER_DAY,
+    STORAGE_KEY_DATA,
+    STORAGE_VERSION,
     UNIT_YEN,
 )
 
@@ -46,41 +48,48 @@ async def async_setup_entry(
     hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
 ) -> None:
     """Set up the Octopus Energy Japan sensor."""
-    email = entry.data[CONF_EMAIL]
-    password = entry.data[CONF_PASSWORD]
     account_number = entry.data[CONF_ACCOUNT_NUMBER]
     scan_interval_hours = entry.options.get(
         CONF_SCAN_INTERVAL, entry.data.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL_HOURS)
     )
 
-    session = async_get_clientsession(hass)
-    api = OctopusEnergyJP(
-        session=session,
-        email=email,
-        password=password,
-        account_number=account_number,
-    )
+    api: OctopusEnergyJP = hass.data[DOMAIN][entry.entry_id]
+    # 保存最近一次的数据，重启后可立即显示
+    data_store = Store(hass, STORAGE_VERSION, STORAGE_KEY_DATA.format(entry_id=entry.entry_id))
 
     # 创建数据协调器
     async def async_update_data() -> Dict[str, Any]:
         """Fetch data from API."""
-        # 获取昨天的总数据
-        yesterday_data = await api.async_get_yesterday_data()
-        
-        # 获取昨天的每小时数据
-        today_utc = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        today_utc = utc_midnight()
         yesterday_utc = today_utc - timedelta(days=1)
-        hourly_data = await api.async_get_hourly_data(yesterday_utc, today_utc)
-        
-        # 如果是首次安装，获取两周的数据
-        if not coordinator.data:
-            two_weeks_data = await api.async_get_two_weeks_data()
-            yesterday_data["two_weeks_data"] = two_weeks_data
-        
-        yesterday_data["hourly_data"] = hourly_data
-        return yesterday_data
-
-    coordinator = DataUpdateCoordinator(
+        yesterday_date = yesterday_utc.date().isoformat()
+
+        # 昨天的每个半小时读数都已包含用量和费用时，当天无需再次请求
+        last_data = coordinator.data
+        if (
+            last_data
+            and last_data.get("date") == yesterday_date
+            and last_data.get("complete_readings", 0) >= READINGS_PER_DAY
+        ):
+            return last_data
+
+        # 一次请求获取昨天的总数据和每小时数据
+        try:
+            data = await api.async_get_combined(
+                yesterday_from=yesterday_utc,
+                yesterday_to=today_utc - timedelta(seconds=1),  # 23:59:59 yesterday
+                hourly_start=yesterday_utc,
+                hourly_end=today_utc,
+            )
+        except (APIError, AuthenticationError) as err:
+            raise UpdateFailed(f"Failed to fetch data: {err}") from err
+
+        data["date"] = yesterday_date
+        data["fetched_at"] = dt_util.utcnow().isoformat()
+        await data_store.async_save(data)
+        return data
+
+    coordinator = OctopusEnergyJPCoordinator(
         hass,
         _LOGGER,
         name=f"{NAME} ({account_number})",
@@ -88,20 +97,83 @@ async def async_setup_entry(
         update_interval=timedelta(hours=scan_interval_hours),
     )
 
-    # 初始数据获取
-    await coordinator.async_config_entry_first_refresh()
+    # 有缓存数据时先使用缓存，在后台刷新；否则等待首次数据获取
+    last_data = await data_store.async_load()
+    if last_data:
+        coordinator.async_set_updated_data(last_data)
+        hass.async_create_background_task(
+            coordinator.async_refresh(), name=f"{DOMAIN} {account_number} refresh"
+        )
+    else:
+        await coordinator.async_config_entry_first_refresh()
 
     entities = [
-        OctopusEnergyJPEnergySensor(coordinator, entry, account_number),
-        OctopusEnergyJPCostSensor(coordinator, entry, account_number),
+        OctopusEnergyJPEnergySensor(coordinator, account_number),
+        OctopusEnergyJPCostSensor(coordinator, account_number),
     ]
 
-    # 更新传感器的每小时数据
-    if coordinator.data and "hourly_data" in coordinator.data:
-        for entity in entities:
-            entity.update_hourly_data(coordinator.data["hourly_data"])
+    async_add_entities(entities)
 
-    async_add_entities(entities, True)
+
+class OctopusEnergyJPCoordinator(DataUpdateCoordinator):
+    """Coordinator that polls less often while the data stays the same."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        logger: logging.Logger,
+        *,
+        name: str,
+        update_method: Callable[[], Awaitable[Dict[str, Any]]],
+        update_interval: timedelta,
+    ) -> None:
+        """Initialize the coordinator."""
+        super().__init__(
+            hass,
+            logger,
+            name=name,
+            update_method=update_method,
+            update_interval=update_interval,
+        )
+        self._base_interval = update_interval
+        self._max_interval = max(update_interval, timedelta(hours=MAX_SCAN_INTERVAL_HOURS))
+
+    @staticmethod
+    def _signature(data: Optional[Dict[str, Any]]) -> Optional[Tuple[Any, Any]]:
+        """Return the values that decide whether the data has changed."""
+        if not data:
+            return None
+        return (data.get("energy_usage"), data.get("energy_cost"))
+
+    async def _async_update_data(self) -> Dict[str, Any]:
+        """Fetch data and adapt the polling interval before the next refresh is scheduled."""
+        try:
+            data = await super()._async_update_data()
+        except Exception:
+            # 获取失败时恢复配置的刷新间隔，以便及时重试
+            self.update_interval = self._base_interval
+            raise
+
+        if self._signature(data) == self._signature(self.data):
+            # 数据未变化时加倍刷新间隔，最长为 MAX_SCAN_INTERVAL_HOURS，
+            # 且不超过下一个 UTC 零点（但不短于配置的刷新间隔）
+            until_midnight = utc_midnight() + timedelta(days=1) - dt_util.utcnow()
+            self.update_interval = min(
+                self.update_interval * 2,
+                self._max_interval,
+                max(self._base_interval, until_midnight),
+            )
+        else:
+            self.update_interval = self._base_interval
+
+        return data
+
+    @callback
+    def _schedule_refresh(self) -> None:
+        """Schedule the next refresh unless Home Assistant is stopping."""
+        if self.hass.state is CoreState.stopping:
+            return
+        super()._schedule_refresh()
 
 
 class OctopusEnergyJPSensorBase(CoordinatorEntity):
@@ -110,7 +182,6 @@ class OctopusEnergyJPSensorBase(CoordinatorEntity):
     def __init__(
         self,
         coordinator: DataUpdateCoordinator,
-        config_entry: ConfigEntry,
         account_number: str,
     ) -> None:
         """Initialize the sensor."""
@@ -123,7 +194,6 @@ class OctopusEnergyJPSensorBase(CoordinatorEntity):
             model="Electricity Supply",
             entry_type="service",
         )
-        self._config_entry = config_entry
         self._attr_attribution = ATTRIBUTION
 
     @property
@@ -131,6 +201,24 @@ class OctopusEnergyJPSensorBase(CoordinatorEntity):
         """Return True if entity is available."""
         return self.coordinator.last_update_success
 
+    @property
+    def extra_state_attributes(self) -> Dict[str, Any]:
+        """Return the state attributes of the sensor."""
+        data = self.coordinator.data or {}
+        # 使用实际从 API 获取数据的时间，而不是协调器的刷新时间
+        fetched_at = data.get("fetched_at")
+        attributes = {
+            "account_number": self._account_number,
+            "last_updated": dt_util.parse_datetime(fetched_at) if fetched_at else None,
+        }
+
+        # Add hourly data if available
+        hourly_data = data.get("hourly_data")
+        if hourly_data:
+            attributes["hourly_data"] = hourly_data
+
+        return attributes
+
 
 class OctopusEnergyJPEnergySensor(OctopusEnergyJPSensorBase, SensorEntity):
     """Sensor for electricity usage."""
@@ -144,14 +232,12 @@ class OctopusEnergyJPEnergySensor(OctopusEnergyJPSensorBase, SensorEntity):
     def __init__(
         self,
         coordinator: DataUpdateCoordinator,
-        config_entry: ConfigEntry,
         account_number: str,
     ) -> None:
         """Initialize the energy usage sensor."""
-        super().__init__(coordinator, config_entry, account_number)
+        super().__init__(coordinator, account_number)
         self._attr_unique_id = f"{account_number}_{ENERGY_USAGE_SENSOR}"
         self._attr_name = "Yesterday's Energy Usage"
-        self._hourly_datag = []
 
     @property
     def native_value(self) -> StateType:
@@ -160,24 +246,6 @@ class OctopusEnergyJPEnergySensor(OctopusEnergyJPSensorBase, SensorEntity):
             return None
         return self.coordinator.data.get("energy_usage")
 
-    @property
-    def extra_state_attributes(self) -> Dict[str, Any]:
-        """Return the state attributes of the sensor."""
-        attributes = {
-            "account_number": self._account_number,
-            "last_updated": self.coordinator.last_update,
-        }
-        
-        # Add hourly data if available
-        if self._hourly_data:
-            attributes["hourly_data"] = self._hourly_data
-            
-        return attributes
-
-    def update_hourly_data(self, hourly_data: List[Dict[str, Any]]) -> None:
-        """Update hourly data."""
-        self._hourly_data = hourly_data
-
 
 class OctopusEnergyJPCostSensor(OctopusEnergyJPSensorBase, SensorEntity):
     """Sensor for electricity cost."""
@@ -191,36 +259,16 @@ class OctopusEnergyJPCostSensor(OctopusEnergyJPSensorBase, SensorEntity):
     def __init__(
         self,
         coordinator: DataUpdateCoordinator,
-        config_entry: ConfigEntry,
         account_number: str,
     ) -> None:
         """Initialize the energy cost sensor."""
-        super().__init__(coordinator, config_entry, account_number)
+        super().__init__(coordinator, account_number)
         self._attr_unique_id = f"{account_number}_{ENERGY_COST_SENSOR}"
         self._attr_name = "Yesterday's Energy Cost"
-        self._hourly_data = []
 
     @property
     def native_value(self) -> StateType:
         """Return the state of the sensor."""
         if not self.coordinator.data:
             return None
-        return self.coordinator.data.get("energy_cost")
-
-    @property
-    def extra_state_attributes(self) -> Dict[str, Any]:
-        """Return the state attributes of the sensor."""
-        attributes = {
-            "account_number": self._account_number,
-            "last_updated": self.coordinator.last_update,
-        }
-        
-        # Add hourly data if available
-        if self._hourly_data:
-            attributes["hourly_data"] = self._hourly_data
-            
-        return attributes
-
-    def update_hourly_data(self, hourly_data: List[Dict[str, Any]]) -> None:
-        """Update hourly data."""
-        self._hourly_data = hourly_data 
\ No newline at end of file
+        return self.coordinator.data.get("energy_cost") 
\ No newline at end of file